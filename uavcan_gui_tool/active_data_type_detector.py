@@ -54,10 +54,10 @@ class ActiveDataTypeDetector(QObject):
                 self.message_types_updated.emit()
 
     def get_names_of_active_messages(self):
-        return list(sorted(self._active_messages))
+        return sorted(self._active_messages)
 
     def get_names_of_active_services(self):
-        return list(sorted(self._active_services))
+        return sorted(self._active_services)
 
     @staticmethod
     def get_names_of_all_message_types_with_data_type_id():
@@ -65,4 +65,4 @@ class ActiveDataTypeDetector(QObject):
         for (dtid, kind), dtype in uavcan.DATATYPES.items():
             if dtid is not None and kind == uavcan.dsdl.CompoundType.KIND_MESSAGE:
                 message_types.append(str(dtype))
-        return list(sorted(message_types))
+        return sorted(message_types)
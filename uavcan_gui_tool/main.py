@@ -6,9 +6,11 @@
 # Author: Pavel Kirienko <pavel.kirienko@zubax.com>
 #
 
+import functools
 import logging
 import multiprocessing
 import os
+import select
 import sys
 import time
 import tempfile
@@ -56,7 +58,7 @@ import uavcan
 
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QSplitter, QAction
 from PyQt5.QtGui import QKeySequence, QDesktopServices
-from PyQt5.QtCore import QTimer, Qt, QUrl
+from PyQt5.QtCore import QTimer, Qt, QUrl, QSocketNotifier
 
 from .version import __version__
 from .iface_configurator import run_iface_config_window
@@ -83,9 +85,122 @@ from .panels import PANELS
 NODE_NAME = 'org.uavcan.gui_tool'
 
 
+# The TYPENAMES mapping never changes at runtime, so the constructors are resolved once per type name;
+# this keeps the dict+attribute lookup out of the request/broadcast hot path
+@functools.lru_cache(maxsize=256)
+def _lookup_message_constructor(full_name):
+    return uavcan.TYPENAMES[full_name]
+
+
+@functools.lru_cache(maxsize=256)
+def _lookup_request_constructor(full_name):
+    return uavcan.TYPENAMES[full_name].Request
+
+
+# uavcan.to_yaml() renders objects via Python-level recursion, which gets expensive when the user
+# subscribes to a high-rate topic with the default print callback. When PyYAML is available with the
+# libyaml-backed dumper, payloads are converted into plain dicts/lists/scalars locally (pyuavcan has
+# no such exporter of its own) and rendering is delegated to the C emitter. Unlike uavcan.to_yaml(),
+# the fast renderer does not annotate values with the names of the matching constants.
+try:
+    import yaml
+    _YAML_DUMPER = getattr(yaml, 'CSafeDumper', None)
+except ImportError:
+    _YAML_DUMPER = None
+
+
+def _message_to_plain_data(m):
+    # Same traversal as the plotter's _extract_struct_fields(), but into YAML-dumpable containers
+    if isinstance(m, uavcan.transport.CompoundValue):
+        out = {}
+        for field_name, field in uavcan.get_fields(m).items():
+            if uavcan.is_union(m) and uavcan.get_active_union_field(m) != field_name:
+                continue
+            value = _message_to_plain_data(field)
+            if value is not None:
+                out[field_name] = value
+        return out
+    elif isinstance(m, uavcan.transport.ArrayValue):
+        if uavcan.get_uavcan_data_type(m).is_string_like:
+            try:
+                return m.decode()
+            except Exception:
+                pass        # Not a valid string, rendering as a regular array
+        return [x for x in (_message_to_plain_data(item) for item in m) if x is not None]
+    elif isinstance(m, uavcan.transport.PrimitiveValue):
+        return m.value
+    elif isinstance(m, (int, float, bool)):
+        return m
+    elif isinstance(m, uavcan.transport.VoidValue):
+        pass
+    else:
+        raise ValueError('Unsupported value type %r' % type(m))
+
+
+def _render_yaml(obj):
+    if _YAML_DUMPER is not None:
+        payload = obj
+        if not isinstance(payload, uavcan.transport.CompoundValue):
+            # Event objects carry the payload under a type-dependent attribute name
+            for attr in ('message', 'request', 'response'):
+                candidate = getattr(obj, attr, None)
+                if isinstance(candidate, uavcan.transport.CompoundValue):
+                    payload = candidate
+                    break
+        if isinstance(payload, uavcan.transport.CompoundValue):
+            try:
+                return yaml.dump(_message_to_plain_data(payload),
+                                 Dumper=_YAML_DUMPER, default_flow_style=False, sort_keys=False).rstrip('\n')
+            except Exception:
+                logger.debug('Fast YAML rendering failed, falling back to uavcan.to_yaml()', exc_info=True)
+    return uavcan.to_yaml(obj)
+
+
+class _PeriodicBroadcaster:
+    """
+    Background re-publisher used by the console broadcast() helper. It is a small slotted class
+    rather than a closure because at short intervals (down to a millisecond) the per-tick overhead
+    of the closure cells becomes measurable.
+    """
+    __slots__ = ('_node', '_payload', '_priority', '_count', '_deadline_ns', '_num_broadcasted', 'handle')
+
+    def __init__(self, node, payload, priority, count, deadline_ns):
+        self._node = node
+        self._payload = payload
+        self._priority = priority
+        self._count = count
+        self._deadline_ns = deadline_ns
+        self._num_broadcasted = 1   # The first message is broadcasted before the job is launched
+        self.handle = None          # Must be assigned by the launcher before the first tick
+
+    def tick(self):
+        try:
+            self._node.broadcast(self._payload, self._priority)
+        except Exception:
+            logger.error('Automatic broadcast failed, job cancelled', exc_info=True)
+            self.handle.remove()
+        else:
+            self._num_broadcasted += 1
+            # The deadline is kept in integer nanoseconds: monotonic_ns() skips the float conversion,
+            # which is worth avoiding when ticking at kilohertz rates
+            if (self._count is not None and self._num_broadcasted >= self._count) or \
+                    time.monotonic_ns() >= self._deadline_ns:
+                logger.info('Background publisher for %r has stopped',
+                            uavcan.get_uavcan_data_type(self._payload).full_name)
+                self.handle.remove()
+
+
 class MainWindow(QMainWindow):
     MAX_SUCCESSIVE_NODE_ERRORS = 1000
 
+    # How long the timer-driven path may keep skipping spin while the bus is idle. Frame reception is
+    # not affected by this - it is handled by the socket notifier; this bounds the worst-case latency
+    # of libuavcan's internally scheduled events (periodic broadcasts, deferred calls, transfer
+    # timeouts), which execute only inside spin(). It must stay small: the node's own NodeStatus and
+    # any console background broadcaster tick from that scheduler, and own-TX does not wake the
+    # notifier.
+    SPIN_DEADLINE_SERVICE_INTERVAL = 0.05
+
     # noinspection PyTypeChecker,PyCallByClass,PyUnresolvedReferences
     def __init__(self, node, iface_name):
         # Parent
@@ -100,9 +215,33 @@ class MainWindow(QMainWindow):
         self._active_data_type_detector = ActiveDataTypeDetector(self._node)
 
         self._node_spin_timer = QTimer(self)
-        self._node_spin_timer.timeout.connect(self._spin_node)
+        self._node_spin_timer.timeout.connect(self._on_spin_timer)
         self._node_spin_timer.setSingleShot(False)
-        self._node_spin_timer.start(10)
+
+        # If the CAN driver exposes a selectable file descriptor, we use it to spin the node only when
+        # there is actually data pending on the bus, rather than waking up the event loop every 10 ms
+        # just to find out that the bus is idle. The timer is still needed to service the internal
+        # deadlines of libuavcan (periodic broadcasts, deferred calls, transfer timeouts), but most
+        # of its ticks then reduce to a cheap select() probe - see _on_spin_timer(). Some drivers
+        # (e.g. SLCAN, which does its IO in a separate process) have no descriptor to watch, so we
+        # fall back to fast polling with them.
+        self._node_socket_notifier = None
+        try:
+            can_driver_fd = self._get_can_driver_file_descriptor()
+        except Exception:
+            can_driver_fd = None
+            logger.info('CAN driver does not expose a file descriptor, using fast timer-driven spinning',
+                        exc_info=True)
+
+        self._can_driver_fd = can_driver_fd
+        self._next_forced_spin_deadline = 0
+
+        if can_driver_fd is not None:
+            self._node_socket_notifier = QSocketNotifier(can_driver_fd, QSocketNotifier.Read, self)
+            self._node_socket_notifier.activated.connect(lambda *_: self._spin_node())
+            self._node_spin_timer.start(25)
+        else:
+            self._node_spin_timer.start(10)
 
         self._node_windows = {}  # node ID : window object
 
@@ -244,7 +383,7 @@ class MainWindow(QMainWindow):
             Formats the argument as YAML structure using uavcan.to_yaml(), and prints the result into stdout.
             Use this function to print received UAVCAN structures.
             """
-            print(uavcan.to_yaml(obj))
+            print(_render_yaml(obj))
 
         def throw_if_anonymous():
             if self._node.is_anonymous:
@@ -264,7 +403,7 @@ class MainWindow(QMainWindow):
             """
             if isinstance(payload, uavcan.dsdl.CompoundType):
                 print('Interpreting the first argument as:', payload.full_name + '.Request()')
-                payload = uavcan.TYPENAMES[payload.full_name].Request()
+                payload = _lookup_request_constructor(payload.full_name)()
             throw_if_anonymous()
             priority = priority or default_transfer_priority
             callback = callback or print_yaml
@@ -332,7 +471,7 @@ class MainWindow(QMainWindow):
             # Validating inputs
             if isinstance(payload, uavcan.dsdl.CompoundType):
                 print('Interpreting the first argument as:', payload.full_name + '()')
-                payload = uavcan.TYPENAMES[payload.full_name]()
+                payload = _lookup_message_constructor(payload.full_name)()
 
             if (interval is None) and (duration is not None or count is not None):
                 raise RuntimeError('Cannot setup background broadcaster: interval is not set')
@@ -340,34 +479,17 @@ class MainWindow(QMainWindow):
             throw_if_anonymous()
 
             # Business end is here
-            def do_broadcast():
-                self._node.broadcast(payload, priority or default_transfer_priority)
-
-            do_broadcast()
+            self._node.broadcast(payload, priority or default_transfer_priority)
 
             if interval is not None:
-                num_broadcasted = 1         # The first was broadcasted before the job was launched
                 if duration is None:
                     duration = 3600 * 24 * 365 * 1000       # See you in 1000 years
-                deadline = time.monotonic() + duration
 
-                def process_next():
-                    nonlocal num_broadcasted
-                    try:
-                        do_broadcast()
-                    except Exception:
-                        logger.error('Automatic broadcast failed, job cancelled', exc_info=True)
-                        timer_handle.remove()
-                    else:
-                        num_broadcasted += 1
-                        if (count is not None and num_broadcasted >= count) or (time.monotonic() >= deadline):
-                            logger.info('Background publisher for %r has stopped',
-                                        uavcan.get_uavcan_data_type(payload).full_name)
-                            timer_handle.remove()
-
-                timer_handle = self._node.periodic(interval, process_next)
-                active_handles.append(timer_handle)
-                return timer_handle
+                broadcaster = _PeriodicBroadcaster(self._node, payload, priority or default_transfer_priority,
+                                                   count, time.monotonic_ns() + int(duration * 1e9))
+                broadcaster.handle = self._node.periodic(interval, broadcaster.tick)
+                active_handles.append(broadcaster.handle)
+                return broadcaster.handle
 
         def subscribe(uavcan_type, callback=None, count=None, duration=None, on_end=None):
             """
@@ -524,9 +646,31 @@ class MainWindow(QMainWindow):
         w.show()
         self._node_windows[node_id] = w
 
+    def _get_can_driver_file_descriptor(self):
+        try:
+            return self._node.can_driver.fileno()
+        except AttributeError:
+            return self._node.can_driver.socket.fileno()    # SocketCAN keeps the socket public
+
+    def _on_spin_timer(self):
+        # Even a zero-timeout spin costs a recvmsg() syscall. When the descriptor is watchable we can
+        # tell in user space that nothing is pending, in which case the spin is skipped unless the
+        # deadline service interval has elapsed.
+        if self._can_driver_fd is not None:
+            now = time.monotonic()
+            if now < self._next_forced_spin_deadline and \
+                    not select.select([self._can_driver_fd], [], [], 0)[0]:
+                return
+            self._next_forced_spin_deadline = now + self.SPIN_DEADLINE_SERVICE_INTERVAL
+        self._spin_node()
+
     def _spin_node(self):
         # We're running the node in the GUI thread.
-        # This is not great, but at the moment seems like other options are even worse.
+        # This is not great, but relocating the spinning into a worker thread would require every
+        # transfer/response handler in the application to marshal its widget updates back into the
+        # GUI thread, and most of them (console callbacks, node properties, the log display) touch
+        # widgets directly. Since the node is spun on demand via the socket notifier rather than on
+        # a fast timer, the residual cost on the paint/input path is small.
         try:
             self._node.spin(0)
             self._successive_node_errors = 0
@@ -541,12 +685,18 @@ class MainWindow(QMainWindow):
                            'Please restart the application.',
                            msg, self)
                 self._node_spin_timer.stop()
+                if self._node_socket_notifier is not None:
+                    self._node_socket_notifier.setEnabled(False)
                 self._node.close()
 
             logger.error(msg, exc_info=True)
             self.statusBar().showMessage(msg, 3000)
 
     def closeEvent(self, qcloseevent):
+        # Stopping the spin sources first so that no handler can fire into half-destroyed widgets
+        self._node_spin_timer.stop()
+        if self._node_socket_notifier is not None:
+            self._node_socket_notifier.setEnabled(False)
         self._plotter_manager.close()
         self._console_manager.close()
         self._active_data_type_detector.close()
@@ -605,16 +605,25 @@ def make_icon_button(icon_name, tool_tip, parent, checkable=False, checked=False
     return b
 
 
-def map_7bit_to_color(value):
-    value = int(value) & 0x7f
+def _make_7bit_color_table():
+    table = []
+    for value in range(128):
+        red = ((value >> 5) & 0b11) * 48        # 2 bits to red
+        green = ((value >> 2) & 0b111) * 12     # 3 bits to green, because human eye is more sensitive here
+        blue = (value & 0b11) * 48              # 2 bits to blue
+
+        col = QColor()
+        col.setRgb(0xFF - red, 0xFF - green, 0xFF - blue)
+        table.append(col)
+    return table
+
 
-    red = ((value >> 5) & 0b11) * 48        # 2 bits to red
-    green = ((value >> 2) & 0b111) * 12     # 3 bits to green, because human eye is more sensitive in this wavelength
-    blue = (value & 0b11) * 48              # 2 bits to blue
+# The mapping is a pure function of the 7-bit input, so all 128 colors are precomputed once at load time
+_7BIT_COLOR_TABLE = _make_7bit_color_table()
 
-    col = QColor()
-    col.setRgb(0xFF - red, 0xFF - green, 0xFF - blue)
-    return col
+
+def map_7bit_to_color(value):
+    return _7BIT_COLOR_TABLE[int(value) & 0x7f]
 
 
 def get_monospace_font():
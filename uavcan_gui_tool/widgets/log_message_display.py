@@ -8,6 +8,7 @@
 
 import uavcan
 import datetime
+from operator import attrgetter
 from PyQt5.QtWidgets import QGroupBox, QVBoxLayout, QHBoxLayout, QHeaderView, QPushButton, QLabel
 from PyQt5.QtCore import Qt
 from logging import getLogger
@@ -29,7 +30,7 @@ def log_level_to_color(level):
 class LogMessageDisplayWidget(QGroupBox):
     COLUMNS = [
         BasicTable.Column('NID',
-                          lambda e: e.transfer.source_node_id),
+                          attrgetter('transfer.source_node_id')),
         BasicTable.Column('Local Time',
                           lambda e: datetime.datetime.fromtimestamp(e.transfer.ts_real)
                           .strftime('%H:%M:%S.%f')[:-3],
@@ -38,9 +39,9 @@ class LogMessageDisplayWidget(QGroupBox):
                           lambda e: (uavcan.value_to_constant_name(e.message.level, 'value'),
                                      log_level_to_color(e.message.level))),
         BasicTable.Column('Source',
-                          lambda e: e.message.source),
+                          attrgetter('message.source')),
         BasicTable.Column('Text',
-                          lambda e: e.message.text,
+                          attrgetter('message.text'),
                           resize_mode=QHeaderView.Stretch),
     ]
 
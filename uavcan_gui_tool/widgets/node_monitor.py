@@ -6,48 +6,92 @@
 # Author: Pavel Kirienko <pavel.kirienko@zubax.com>
 #
 
+import os
+import bisect
 import datetime
 import uavcan
+from operator import attrgetter
 from . import BasicTable, get_monospace_font
-from PyQt5.QtWidgets import QGroupBox, QVBoxLayout, QHeaderView, QLabel
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QGroupBox, QVBoxLayout, QHeaderView, QLabel, QTableView, QAbstractItemView, \
+    QApplication
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QBrush, QKeySequence
 from logging import getLogger
 
 
 logger = getLogger(__name__)
 
 
-def node_mode_to_color(mode):
+_constant_name_cache = {}
+
+
+def _status_value_to_constant_name(status, field_name):
+    # value_to_constant_name() walks the DSDL type descriptor on every call, but its result is a pure
+    # function of the field and its raw value, so the lookups are memoized here; the table renders
+    # every visible row twice per second, which makes this path surprisingly hot
+    key = (field_name, getattr(status, field_name))
+    try:
+        return _constant_name_cache[key]
+    except KeyError:
+        name = uavcan.value_to_constant_name(status, field_name)
+        _constant_name_cache[key] = name
+        return name
+
+
+def _make_status_color_maps():
+    # The constants never change, so instantiating a NodeStatus and building the mappings on every
+    # call (i.e. per rendered cell) would be a waste; they are precomputed here once at load time
     s = uavcan.protocol.NodeStatus()
-    return {
+    mode_colors = {
         s.MODE_INITIALIZATION: Qt.cyan,
         s.MODE_MAINTENANCE: Qt.magenta,
         s.MODE_SOFTWARE_UPDATE: Qt.magenta,
         s.MODE_OFFLINE: Qt.red
-    }.get(mode)
-
-
-def node_health_to_color(health):
-    s = uavcan.protocol.NodeStatus()
-    return {
+    }
+    health_colors = {
         s.HEALTH_WARNING: Qt.yellow,
         s.HEALTH_ERROR: Qt.magenta,
         s.HEALTH_CRITICAL: Qt.red,
-    }.get(health)
+    }
+    return mode_colors, health_colors
+
+
+_NODE_MODE_COLORS, _NODE_HEALTH_COLORS = _make_status_color_maps()
+
+
+def node_mode_to_color(mode):
+    return _NODE_MODE_COLORS.get(mode)
+
+
+def node_health_to_color(health):
+    return _NODE_HEALTH_COLORS.get(health)
+
+
+class _Row:
+    """
+    Per-row state of the node table model. Every row is touched on every update tick, so __slots__
+    is used to keep the instances compact and the attribute access fixed-offset.
+    """
+    __slots__ = ('node_id', 'entry', 'rendered_timestamp')
+
+    def __init__(self, entry):
+        self.node_id = entry.node_id
+        self.entry = entry
+        self.rendered_timestamp = entry.monotonic_timestamp
 
 
-class NodeTable(BasicTable):
+class NodeTableModel(QAbstractTableModel):
     COLUMNS = [
         BasicTable.Column('NID',
-                          lambda e: e.node_id),
+                          attrgetter('node_id')),        # C-implemented, cheaper than a lambda per render
         BasicTable.Column('Name',
                           lambda e: e.info.name if e.info else '?',
                           QHeaderView.Stretch),
         BasicTable.Column('Mode',
-                          lambda e: (uavcan.value_to_constant_name(e.status, 'mode'),
+                          lambda e: (_status_value_to_constant_name(e.status, 'mode'),
                                      node_mode_to_color(e.status.mode))),
         BasicTable.Column('Health',
-                          lambda e: (uavcan.value_to_constant_name(e.status, 'health'),
+                          lambda e: (_status_value_to_constant_name(e.status, 'health'),
                                      node_health_to_color(e.status.health))),
         BasicTable.Column('Uptime',
                           lambda e: datetime.timedelta(days=0, seconds=e.status.uptime_sec)),
@@ -56,71 +100,166 @@ class NodeTable(BasicTable):
                                                     e.status.vendor_specific_status_code))
     ]
 
-    info_requested = pyqtSignal([int])
-
     def __init__(self, parent, node):
-        super(NodeTable, self).__init__(parent, self.COLUMNS, font=get_monospace_font())
-
-        self.cellDoubleClicked.connect(lambda row, col: self._call_info_requested_callback_on_row(row))
-        self.on_enter_pressed = self._on_enter
+        super(NodeTableModel, self).__init__(parent)
 
         self._monitor = uavcan.app.node_monitor.NodeMonitor(node)
 
+        # Rows sorted by node ID, and the matching sorted list of node IDs;
+        # the latter makes the insertion position lookup logarithmic
+        self._rows = []
+        self._node_ids = []
+
+        # Refreshes are driven by the monitor events and coalesced: however many updates arrive
+        # within one event loop turn, only one refresh runs. The slow timer remains solely to evict
+        # nodes that went silent, since their disappearance produces no event.
+        self._update_scheduled = False
+        self._monitor_handle = self._monitor.add_update_handler(lambda _: self._schedule_update())
+
         self._timer = QTimer(self)
         self._timer.setSingleShot(False)
         self._timer.timeout.connect(self._update)
-        self._timer.start(500)
-
-        self.setMinimumWidth(500)
+        self._timer.start(2000)
 
     @property
     def monitor(self):
         return self._monitor
 
     def close(self):
+        self._monitor_handle.remove()
+        self._timer.stop()
         self._monitor.close()
 
-    def _call_info_requested_callback_on_row(self, row):
-        nid = int(self.item(row, 0).text())
-        self.info_requested.emit(nid)
-
-    def _on_enter(self, list_of_row_col_pairs):
-        unique_rows = set([row for row, _col in list_of_row_col_pairs])
-        if len(unique_rows) == 1:
-            self._call_info_requested_callback_on_row(list(unique_rows)[0])
+    def _schedule_update(self):
+        if not self._update_scheduled:
+            self._update_scheduled = True
+            QTimer.singleShot(0, self._update)
+
+    def node_id_at(self, row):
+        return self._rows[row].node_id
+
+    def render_row_as_string(self, row):
+        cells = []
+        for column in self.COLUMNS:
+            value = column.render(self._rows[row].entry)
+            if isinstance(value, tuple):
+                value = value[0]
+            cells.append(str(value))
+        return '\t'.join(cells)
+
+    # noinspection PyMethodOverriding
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    # noinspection PyMethodOverriding
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.COLUMNS)
+
+    # noinspection PyMethodOverriding
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section].name
+
+    # noinspection PyMethodOverriding
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole or role == Qt.BackgroundRole:
+            value = self.COLUMNS[index.column()].render(self._rows[index.row()].entry)
+            color = None
+            if isinstance(value, tuple):
+                value, color = value
+            if role == Qt.DisplayRole:
+                return str(value)
+            return QBrush(color) if color is not None else None
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignVCenter | Qt.AlignLeft)
+        return None
 
     def _update(self):
+        self._update_scheduled = False
         known_nodes = {e.node_id: e for e in self._monitor.find_all(lambda _: True)}
-        displayed_nodes = set()
-        rows_to_remove = []
-
-        # Updating existing entries
-        for row in range(self.rowCount()):
-            nid = int(self.item(row, 0).text())
-            displayed_nodes.add(nid)
-            if nid not in known_nodes:
-                rows_to_remove.append(row)
-            else:
-                self.set_row(row, known_nodes[nid])
 
-        # Removing nonexistent entries
-        for row in rows_to_remove[::-1]:     # It is important to traverse from end
-            logger.info('Removing row %d', row)
-            self.removeRow(row)
+        # Updating existing entries; rows whose timestamp didn't advance are skipped entirely
+        for row_index, row in enumerate(self._rows):
+            entry = known_nodes.get(row.node_id)
+            if entry is not None and row.rendered_timestamp != entry.monotonic_timestamp:
+                row.entry = entry
+                row.rendered_timestamp = entry.monotonic_timestamp
+                self.dataChanged.emit(self.index(row_index, 0), self.index(row_index, len(self.COLUMNS) - 1))
+
+        # Removing nonexistent entries; it is important to traverse from end to keep row indexes valid
+        for row_index in range(len(self._rows) - 1, -1, -1):
+            if self._rows[row_index].node_id not in known_nodes:
+                logger.info('Removing row %d', row_index)
+                self.beginRemoveRows(QModelIndex(), row_index, row_index)
+                del self._node_ids[row_index]
+                del self._rows[row_index]
+                self.endRemoveRows()
 
         # Adding new entries
-        def find_insertion_pos_for_node_id(target_nid):
-            for row in range(self.rowCount()):
-                nid = int(self.item(row, 0).text())
-                if nid > target_nid:
-                    return row
-            return self.rowCount()
+        for nid in sorted(known_nodes.keys() - set(self._node_ids)):
+            row_index = bisect.bisect_left(self._node_ids, nid)
+            logger.info('Adding new row %d for node %d', row_index, nid)
+            self.beginInsertRows(QModelIndex(), row_index, row_index)
+            self._node_ids.insert(row_index, nid)
+            self._rows.insert(row_index, _Row(known_nodes[nid]))
+            self.endInsertRows()
+
+
+class NodeTable(QTableView):
+    info_requested = pyqtSignal([int])
+
+    def __init__(self, parent, node):
+        super(NodeTable, self).__init__(parent)
+
+        # Model/view allows the view to repaint only the cells that have actually changed, instead of
+        # rebuilding a QTableWidgetItem per cell per update the way the old QTableWidget version did
+        self._model = NodeTableModel(self, node)
+        self.setModel(self._model)
+
+        self.setFont(get_monospace_font())
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+        self.verticalHeader().setVisible(False)
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(20)             # TODO: I feel this is not very portable
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        for idx, col in enumerate(NodeTableModel.COLUMNS):
+            self.horizontalHeader().setSectionResizeMode(idx, col.resize_mode)
+
+        self.doubleClicked.connect(lambda index: self.info_requested.emit(self._model.node_id_at(index.row())))
 
-        for nid in set(known_nodes.keys()) - displayed_nodes:
-            row = find_insertion_pos_for_node_id(nid)
-            logger.info('Adding new row %d for node %d', row, nid)
-            self.insertRow(row)
-            self.set_row(row, known_nodes[nid])
+        self.setMinimumWidth(500)
+
+    @property
+    def monitor(self):
+        return self._model.monitor
+
+    def close(self):
+        self._model.close()
+
+    def keyPressEvent(self, qkeyevent):
+        if qkeyevent.matches(QKeySequence.Copy):
+            selected_rows = [x.row() for x in self.selectionModel().selectedRows()]
+            logger.info('Copy to clipboard requested [%r rows]' % len(selected_rows))
+
+            out_string = ''
+            for row in selected_rows:
+                out_string += self._model.render_row_as_string(row) + os.linesep
+
+            if out_string:
+                QApplication.clipboard().setText(out_string)
+        else:
+            super(NodeTable, self).keyPressEvent(qkeyevent)
+
+        if qkeyevent.matches(QKeySequence.InsertParagraphSeparator):
+            unique_rows = set(x.row() for x in self.selectedIndexes())
+            if len(unique_rows) == 1:
+                self.info_requested.emit(self._model.node_id_at(list(unique_rows)[0]))
 
 
 class NodeMonitorWidget(QGroupBox):
@@ -139,8 +278,6 @@ class NodeMonitorWidget(QGroupBox):
         self._table = NodeTable(self, node)
         self._table.info_requested.connect(self._show_info_window)
 
-        self._monitor_handle = self._table.monitor.add_update_handler(lambda _: self._update_status())
-
         self._status_label = QLabel(self)
 
         vbox = QVBoxLayout(self)
@@ -154,7 +291,6 @@ class NodeMonitorWidget(QGroupBox):
 
     def close(self):
         self._table.close()
-        self._monitor_handle.remove()
         self._status_update_timer.stop()
 
     def _update_status(self):